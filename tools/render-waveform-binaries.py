@@ -7,10 +7,105 @@ import uuid
 import numpy as np
 import subprocess
 import sys
-from scipy.signal import resample
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from scipy.signal import firwin, resample_poly, upfirdn
+
+try:
+    from numba import guvectorize, njit, prange, float32, int64
+    numba_available = True
+except ImportError:
+    numba_available = False
 
 binary_resolution_horizontal = 4096 # target horizontal pixels
+parallel_binning_threshold = 4_194_304 # scalar samples; above this, split bins across cores
+true_peak_upsample = 4 # oversampling factor for true-peak detection
+streaming_threshold = 512 * 1024 * 1024 # bytes of decoded PCM; above this, bin from the pipe in blocks
+streaming_bins_per_block = 64 # bins consumed per pipe read in the streaming path
+
+# Polyphase coefficients designed once at module load and reused for every file,
+# instead of redesigning the Kaiser filter per bin and channel
+true_peak_filter = (firwin(10 * true_peak_upsample + 1, 1.0 / true_peak_upsample,
+                           window=("kaiser", 5.0)) * true_peak_upsample).astype(np.float32)
+
+if numba_available:
+    @guvectorize([(float32[:, :], int64[:], float32[:, :], float32[:, :])],
+                 '(n,c),(b)->(c,b),(c,b)', nopython=True, cache=True)
+    def bin_peak_rms(raw, starts, peak_out, mean_out):
+        """
+        Fused single-pass binning: per-bin max(|x|) and RMS per channel.
+        raw: (N, channel_count), starts: (bins,) sample index of each bin start.
+        Outputs are channel-major (channel_count, bins) so each channel's
+        series is one contiguous row.
+        """
+        num_samples, num_channels = raw.shape
+        num_bins = starts.shape[0]
+        for b in range(num_bins):
+            start = starts[b]
+            end = starts[b + 1] if b + 1 < num_bins else num_samples
+            for ch in range(num_channels):
+                peak_out[ch, b] = 0.0
+                mean_out[ch, b] = 0.0
+            for i in range(start, end):
+                for ch in range(num_channels):
+                    value = abs(raw[i, ch])
+                    if value > peak_out[ch, b]:
+                        peak_out[ch, b] = value
+                    mean_out[ch, b] += value * value
+            if end > start:
+                for ch in range(num_channels):
+                    mean_out[ch, b] = np.sqrt(mean_out[ch, b] / (end - start))
+
+    @njit(parallel=True, nogil=True, cache=True)
+    def bin_peak_rms_par(raw, starts):
+        """
+        Parallel variant of bin_peak_rms: bins are independent, so prange
+        splits them across cores (thread count honors NUMBA_NUM_THREADS).
+        """
+        num_samples, num_channels = raw.shape
+        num_bins = starts.shape[0]
+        peak_out = np.zeros((num_channels, num_bins), dtype=np.float32)
+        mean_out = np.zeros((num_channels, num_bins), dtype=np.float32)
+        for b in prange(num_bins):
+            start = starts[b]
+            end = starts[b + 1] if b + 1 < num_bins else num_samples
+            for i in range(start, end):
+                for ch in range(num_channels):
+                    value = abs(raw[i, ch])
+                    if value > peak_out[ch, b]:
+                        peak_out[ch, b] = value
+                    mean_out[ch, b] += value * value
+            if end > start:
+                for ch in range(num_channels):
+                    mean_out[ch, b] = np.sqrt(mean_out[ch, b] / (end - start))
+        return peak_out, mean_out
+
+    @njit(parallel=True, nogil=True, fastmath=True, boundscheck=False, cache=True)
+    def bin_peak_rms_c16(raw, starts):
+        """
+        16-channel specialization of bin_peak_rms_par: the constant channel
+        bound lets LLVM SIMD-vectorize the inner loop into two float32x8
+        lanes per sample, which a runtime bound defeats.
+        """
+        num_samples = raw.shape[0]
+        num_bins = starts.shape[0]
+        peak_out = np.zeros((16, num_bins), dtype=np.float32)
+        mean_out = np.zeros((16, num_bins), dtype=np.float32)
+        for b in prange(num_bins):
+            start = starts[b]
+            end = starts[b + 1] if b + 1 < num_bins else num_samples
+            for i in range(start, end):
+                for ch in range(16):
+                    value = abs(raw[i, ch])
+                    if value > peak_out[ch, b]:
+                        peak_out[ch, b] = value
+                    mean_out[ch, b] += value * value
+            if end > start:
+                for ch in range(16):
+                    mean_out[ch, b] = np.sqrt(mean_out[ch, b] / (end - start))
+        return peak_out, mean_out
 
+@lru_cache(maxsize=None)
 def get_channel_count(input_file):
     try:
         result = subprocess.run(
@@ -22,14 +117,54 @@ def get_channel_count(input_file):
         print(f"Error reading file: {error.stderr.strip()}")
         sys.exit(1)
 
-def generate_raw(input_file, output_dir):
-    raw_path = os.path.join(output_dir, os.path.splitext(os.path.basename(input_file))[0] + ".raw")
+@lru_cache(maxsize=None)
+def get_sample_count(input_file):
+    """
+    Total sample frames via ffprobe, or None when the probe reports no usable
+    duration (e.g. duration=N/A on some streams). duration_ts is exact when
+    the stream timebase is 1/sample_rate (the usual case for CAF/WAV);
+    otherwise fall back to duration * sample_rate.
+    """
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=duration_ts,sample_rate,duration,time_base", "-of", "default=noprint_wrappers=1", input_file],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
+        )
+    except subprocess.CalledProcessError as error:
+        print(f"Error reading file: {error.stderr.strip()}")
+        sys.exit(1)
+    fields = dict(line.split("=", 1) for line in result.stdout.strip().splitlines())
+    try:
+        sample_rate = int(fields["sample_rate"])
+        if fields.get("time_base") == f"1/{sample_rate}" and fields.get("duration_ts", "N/A") != "N/A":
+            return int(fields["duration_ts"])
+        return int(float(fields["duration"]) * sample_rate)
+    except (KeyError, ValueError):
+        return None
+
+def decode_audio(input_file):
+    """
+    Decode to interleaved f32le samples straight from ffmpeg's stdout,
+    skipping the .raw file roundtrip through the filesystem.
+    """
     cmd = [
-        "ffmpeg", "-y", "-i", input_file,
-        "-f", "f32le", raw_path
+        "ffmpeg", "-v", "error", "-i", input_file,
+        "-f", "f32le", "-"
     ]
-    subprocess.run(cmd, check=True)
-    return raw_path
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+    # bytearray makes the buffer writable for the in-place binning math
+    return np.frombuffer(bytearray(result.stdout), dtype=np.float32)
+
+def decode_audio_stream(input_file):
+    """
+    Same f32le decode as decode_audio, but as a running process whose stdout
+    is consumed in blocks, so the full file never sits in memory.
+    """
+    cmd = [
+        "ffmpeg", "-v", "error", "-i", input_file,
+        "-f", "f32le", "-"
+    ]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE)
 
 def true_peak(segment, upsample=4):
     """
@@ -37,109 +172,309 @@ def true_peak(segment, upsample=4):
     upsample: factor to interpolate
     returns: true peak per channel
     """
-    N, C = segment.shape
-    true_peaks = np.zeros(C, dtype=np.float64)
-
-    for ch in range(C):
-        # Upsample by factor
-        seg_upsampled = resample(segment[:, ch], N * upsample)
-        true_peaks[ch] = np.max(np.abs(seg_upsampled))
-
-    return true_peaks
+    # Polyphase upsampling: O(N*L) with no FFT-length pathologies.
+    # resample_poly vectorizes natively over channels, so no Python loop.
+    seg_upsampled = resample_poly(segment, up=upsample, down=1, axis=0, window=("kaiser", 5.0))
+    np.abs(seg_upsampled, out=seg_upsampled)
+    return np.max(seg_upsampled, axis=0)
 
 def perceptual_scale(x, mode="sqrt"):
+    """
+    x: non-negative amplitudes (peaks or RMS), so no abs pass is needed here
+    """
     if mode == "log":
-        return np.log10(1 + np.abs(x)) / np.log10(1 + 1)
+        return np.log10(1 + x) / np.log10(1 + 1)
     elif mode == "sqrt":
-        return np.sqrt(np.abs(x))
+        return np.sqrt(x)
     elif mode == "cbrt":
-        return np.cbrt(np.abs(x))
+        return np.cbrt(x)
     else:  # lin
-        return np.abs(x)
+        return x
 
-def generate_peak_and_mean(raw_path, channels, output_dir):
-    # Read raw PCM
-    raw = np.fromfile(raw_path, dtype=np.float32)
+def save_binaries(peak, mean, output_dir):
+    """
+    peak/mean: (width, channels) float32, written as interleaved float32.
+    Pre-allocated mappings flush straight to disk without a serialization copy.
+    """
+    peak_out = np.memmap(os.path.join(output_dir, "peak.bin"), dtype=np.float32, mode="w+", shape=peak.shape)
+    mean_out = np.memmap(os.path.join(output_dir, "mean.bin"), dtype=np.float32, mode="w+", shape=mean.shape)
+    peak_out[:] = peak
+    mean_out[:] = mean
+    peak_out.flush()
+    mean_out.flush()
+
+def parse_astats(metadata_text, channels):
+    """
+    Collect per-window, per-channel Peak_level/RMS_level (dBFS) from the
+    output of ffmpeg's ametadata=print filter.
+    """
+    peaks, rmss = [], []
+    for line in metadata_text.splitlines():
+        if line.startswith("frame:"):
+            peaks.append([-np.inf] * channels)
+            rmss.append([-np.inf] * channels)
+        elif line.startswith("lavfi.astats."):
+            key, _, value = line.partition("=")
+            parts = key.split(".")
+            ch = int(parts[2]) - 1
+            if parts[3] == "Peak_level":
+                peaks[-1][ch] = float(value)
+            elif parts[3] == "RMS_level":
+                rmss[-1][ch] = float(value)
+    return np.array(peaks, dtype=np.float32), np.array(rmss, dtype=np.float32)
+
+def generate_peak_and_mean_ffmpeg(input_file, channels, output_dir):
+    """
+    Delegate the per-bin peak/RMS loop to ffmpeg's astats filter (C + SIMD):
+    one analysis window per output bin, read back as filter metadata, so no
+    raw PCM ever lands in Python.
+    """
+    sample_count = get_sample_count(input_file)
+    samples_per_bin = max(1, -(-sample_count // binary_resolution_horizontal))
+    filters = (
+        f"asetnsamples=n={samples_per_bin},"
+        "astats=metadata=1:reset=1"
+        ":measure_perchannel=Peak_level+RMS_level:measure_overall=none,"
+        "ametadata=print:file=-"
+    )
+    cmd = [
+        "ffmpeg", "-v", "error", "-i", input_file,
+        "-af", filters, "-f", "null", "-"
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
+    peak_db, rms_db = parse_astats(result.stdout, channels)
+
+    # dB -> linear once, vectorized; silence (-inf dB) maps cleanly to 0
+    peak = 10.0 ** (peak_db / 20.0)
+    mean = perceptual_scale(10.0 ** (rms_db / 20.0), mode="sqrt")
+
+    # ffmpeg decides the exact window count from the real stream length, so
+    # map whatever it emitted onto the fixed horizontal resolution
+    num_windows = len(peak)
+    idx = (np.arange(binary_resolution_horizontal) * num_windows) // binary_resolution_horizontal
+    save_binaries(peak[idx], mean[idx], output_dir)
+
+def generate_peak_and_mean(raw, channels, output_dir, use_true_peak=False):
+    # Interleaved f32le samples, one row per frame
     original_sample_count = len(raw) // channels
     raw = raw.reshape((original_sample_count, channels))
 
-    # Bin samples to match image width
-    samples_per_bin = original_sample_count / binary_resolution_horizontal
+    # Nothing decoded: write silent binaries instead of tripping reduceat
+    # on an empty array
+    if original_sample_count == 0:
+        zeros = np.zeros((binary_resolution_horizontal, channels), dtype=np.float32)
+        save_binaries(zeros, zeros, output_dir)
+        return
+
+    # Bin samples to match image width: integer edges computed once, shared
+    # as reduction indices and bin sizes
+    edges = np.linspace(0, original_sample_count, binary_resolution_horizontal + 1).astype(np.int64)
+    starts = edges[:-1]
 
-    # Prepare arrays for peak and mean
+    if use_true_peak:
+        # True peak per channel: upsample the whole file in one polyphase pass
+        # with the precomputed filter, then reduce per bin in upsampled indices
+        upsampled = upfirdn(true_peak_filter, raw, up=true_peak_upsample, axis=0)
+        np.abs(upsampled, out=upsampled)
+        peak = np.maximum.reduceat(upsampled, starts * true_peak_upsample, axis=0)[:binary_resolution_horizontal].T
+
+        counts = np.diff(edges).astype(np.float32)[:, None]
+        np.square(raw, out=raw)
+        sums = np.add.reduceat(raw, starts, axis=0)[:binary_resolution_horizontal]
+        # RMS and sqrt perceptual scale fused in place: sqrt(sqrt(mean(x^2)));
+        # inputs shorter than the resolution leave empty bins, so clamp
+        # counts to keep them finite
+        np.divide(sums, np.maximum(counts, 1), out=sums)
+        np.power(sums, 0.25, out=sums)
+        mean = sums.T
+    elif numba_available:
+        # Fused single pass over raw: peak and RMS per bin, no temporaries.
+        # Large inputs split the independent bins across cores.
+        if channels == 16:
+            peak, mean = bin_peak_rms_c16(raw, starts)
+        elif original_sample_count * channels > parallel_binning_threshold:
+            peak, mean = bin_peak_rms_par(raw, starts)
+        else:
+            peak, mean = bin_peak_rms(raw, starts)
+        # RMS is non-negative, so perceptual_scale runs without an abs pass
+        mean = perceptual_scale(mean, mode="sqrt")
+    else:
+        # Peak amplitude per channel, all bins in one C-level reduction.
+        # abs and square run in place on raw (|x|^2 == x^2), so neither
+        # reduction allocates an input-sized temporary.
+        np.abs(raw, out=raw)
+        peak = np.maximum.reduceat(raw, starts, axis=0)[:binary_resolution_horizontal].T
+
+        # RMS amplitude per channel
+        counts = np.diff(edges).astype(np.float32)[:, None]
+        np.square(raw, out=raw)
+        sums = np.add.reduceat(raw, starts, axis=0)[:binary_resolution_horizontal]
+        # RMS and sqrt perceptual scale fused in place: sqrt(sqrt(mean(x^2)));
+        # inputs shorter than the resolution leave empty bins, so clamp
+        # counts to keep them finite
+        np.divide(sums, np.maximum(counts, 1), out=sums)
+        np.power(sums, 0.25, out=sums)
+        mean = sums.T
+
+    # peak/mean are channel-major (SoA) internally; the .bin format stays
+    # width-major interleaved float32, so transpose back on the way out
+    save_binaries(peak.T, mean.T, output_dir)
+
+
+def generate_peak_and_mean_streaming(stream, sample_count, channels, output_dir):
+    """
+    Chunked variant of generate_peak_and_mean for very long files: consumes
+    the ffmpeg pipe in blocks aligned to bin boundaries, so the working set
+    stays a few MB and decode overlaps with binning. sample_count comes from
+    ffprobe; any drift against the real stream length lands in the last bin.
+    """
+    edges = np.linspace(0, sample_count, binary_resolution_horizontal + 1).astype(np.int64)
     peak = np.zeros((binary_resolution_horizontal, channels), dtype=np.float32)
-    mean = np.zeros((binary_resolution_horizontal, channels), dtype=np.float32)
+    sums = np.zeros((binary_resolution_horizontal, channels), dtype=np.float32)
+    counts = np.zeros((binary_resolution_horizontal, 1), dtype=np.float32)
+    frame_bytes = channels * 4
 
-    for x in range(binary_resolution_horizontal):
-        start = int(x * samples_per_bin)
-        end = int((x + 1) * samples_per_bin)
-        segment = raw[start:end]
+    for b0 in range(0, binary_resolution_horizontal, streaming_bins_per_block):
+        b1 = min(b0 + streaming_bins_per_block, binary_resolution_horizontal)
+        data = stream.read(int(edges[b1] - edges[b0]) * frame_bytes)
+        block = np.frombuffer(bytearray(data), dtype=np.float32)
+        block_frames = len(block) // channels
+        if block_frames == 0:
+            break
+        block = block[:block_frames * channels].reshape((block_frames, channels))
 
-        # Peak amplitude per channel
-        peak[x] = np.max(np.abs(segment), axis=0)
+        # Local bin starts within this block; short final reads drop the
+        # bins the stream never reached
+        starts_local = (edges[b0:b1] - edges[b0])
+        starts_local = starts_local[starts_local < block_frames]
+        covered = len(starts_local)
 
-        # True peak per channel (x60 slower than mean)
-        # peak[x] = true_peak(segment, upsample=8)
+        np.abs(block, out=block)
+        peak[b0:b0 + covered] = np.maximum.reduceat(block, starts_local, axis=0)
+        np.square(block, out=block)
+        sums[b0:b0 + covered] = np.add.reduceat(block, starts_local, axis=0)
+        counts[b0:b0 + covered, 0] = np.diff(np.append(starts_local, block_frames))
 
-        # Mean amplitude per channel
-        # mean[x] = np.mean(np.abs(segment), axis=0)
+    # If the probe undercounted, fold whatever ffmpeg still delivers into
+    # the last bin instead of dropping it
+    rest = stream.read()
+    if rest:
+        block = np.frombuffer(bytearray(rest), dtype=np.float32)
+        block_frames = len(block) // channels
+        if block_frames > 0:
+            block = block[:block_frames * channels].reshape((block_frames, channels))
+            np.abs(block, out=block)
+            np.maximum(peak[-1], block.max(axis=0), out=peak[-1])
+            np.square(block, out=block)
+            sums[-1] += block.sum(axis=0)
+            counts[-1] += block_frames
 
-        # RMS amplitude per channel
-        mean[x] = np.sqrt(np.mean(segment.astype(np.float32)**2, axis=0))
-        mean[x] = perceptual_scale(mean[x], mode="sqrt")
+    # RMS and sqrt perceptual scale fused in place: sqrt(sqrt(mean(x^2)))
+    np.divide(sums, np.maximum(counts, 1), out=sums)
+    np.power(sums, 0.25, out=sums)
+    save_binaries(peak, sums, output_dir)
 
-    peak_path = os.path.join(output_dir, "peak.bin")
-    mean_path = os.path.join(output_dir, "mean.bin")
+def process_file(input_file, output_dir, channels, use_true_peak=False, via_ffmpeg=False):
+    # Both alternative paths need the stream length up front; an unparseable
+    # probe just means the file is decoded whole like before
+    sample_count = get_sample_count(input_file)
+    if via_ffmpeg and sample_count is None:
+        print(f"No usable duration from ffprobe for '{input_file}', using the default engine.")
+        via_ffmpeg = False
 
-    # Save as float32 binary files
-    peak.astype(np.float32).tofile(peak_path)
-    mean.astype(np.float32).tofile(mean_path)
+    if via_ffmpeg:
+        generate_peak_and_mean_ffmpeg(input_file, channels, output_dir)
+    elif (not use_true_peak and sample_count is not None
+          and sample_count * channels * 4 > streaming_threshold):
+        # Too big to hold decoded in RAM: bin straight off the decode pipe
+        proc = decode_audio_stream(input_file)
+        generate_peak_and_mean_streaming(proc.stdout, sample_count, channels, output_dir)
+        proc.stdout.close()
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    else:
+        raw = decode_audio(input_file)
+        generate_peak_and_mean(raw, channels, output_dir, use_true_peak=use_true_peak)
+    print(f"Successfully generated waveform and background binaries to ./{output_dir}/")
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Process an audio file and generate waveform image binaries.")
-    parser.add_argument("input_file", help="Input audio file")
+    parser = argparse.ArgumentParser(description="Process audio files and generate waveform image binaries.")
+    parser.add_argument("input_files", nargs="+", help="Input audio file(s)")
     parser.add_argument("--output-dir", default=None, help="Directory for output files")
     parser.add_argument(
         "--uuid-output-dir",
         action="store_true",
         help="Append a UUID to the output directory name to avoid collisions"
     )
+    parser.add_argument(
+        "--true-peak",
+        action="store_true",
+        help="Detect inter-sample (true) peaks via polyphase oversampling (slower)"
+    )
+    parser.add_argument(
+        "--via-ffmpeg",
+        action="store_true",
+        help="Compute peak/RMS with ffmpeg's astats filter instead of numpy (no raw PCM in Python)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum parallel worker processes for batch runs (default: CPU count)"
+    )
     args = parser.parse_args()
-    input_file = args.input_file
+    input_files = args.input_files
 
-    if not os.path.exists(input_file):
-        print(f"Error: The file '{input_file}' does not exist.")
-        sys.exit(1)
-
-    fresh_uuid = uuid.uuid4()
-    output_dir = os.path.splitext(os.path.basename(input_file))[0]
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            print(f"Error: The file '{input_file}' does not exist.")
+            sys.exit(1)
 
-    if args.output_dir:
-        output_dir = args.output_dir
-    else:
+    jobs = []
+    for input_file in input_files:
         output_dir = os.path.splitext(os.path.basename(input_file))[0]
-        if getattr(args, "uuid_output_dir", False):
+        if args.output_dir:
+            if len(input_files) == 1:
+                output_dir = args.output_dir
+            else:
+                output_dir = os.path.join(args.output_dir, output_dir)
+        elif getattr(args, "uuid_output_dir", False):
             output_dir = f"{output_dir}_{uuid.uuid4()}"
 
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        jobs.append((input_file, output_dir))
 
-    try:
-        channels = get_channel_count(input_file)
-        print(f"{channels} channels detected.")
-    except SystemExit:
-        raise
-    except Exception as error:
-        print(f"Unexpected error: {error}")
-        sys.exit(1)
+    # Probe each file once up front; workers get the channel count passed in
+    # instead of re-running ffprobe
+    channel_counts = {}
+    for input_file, _ in jobs:
+        try:
+            channels = get_channel_count(input_file)
+            print(f"{channels} channels detected.")
+            channel_counts[input_file] = channels
+        except SystemExit:
+            raise
+        except Exception as error:
+            print(f"Unexpected error: {error}")
+            sys.exit(1)
 
     try:
-        channels = get_channel_count(input_file)
-        raw_path = generate_raw(input_file, output_dir)
-        meta = generate_peak_and_mean(raw_path, channels, output_dir)
-        os.remove(raw_path)
-        print(f"Successfully generated waveform and background binaries to ./{output_dir}/")
+        if len(jobs) == 1:
+            input_file, output_dir = jobs[0]
+            process_file(input_file, output_dir, channel_counts[input_file],
+                         use_true_peak=args.true_peak, via_ffmpeg=args.via_ffmpeg)
+        else:
+            # Files are independent, so fan out across cores
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                futures = [
+                    pool.submit(process_file, input_file, output_dir, channel_counts[input_file],
+                                args.true_peak, args.via_ffmpeg)
+                    for input_file, output_dir in jobs
+                ]
+                for future in futures:
+                    future.result()
     except SystemExit:
         raise
     except Exception as error:
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def visualize_bin(bin_path, channels):
+    data = np.fromfile(bin_path, dtype=np.float32)
+    bin_count = len(data) // channels
+    # Single trim+reshape; the trim only matters for truncated files
+    data = data[:bin_count * channels].reshape((bin_count, channels))
+
+    # One vectorized plot call draws all channels (one Line2D per column),
+    # offset so the channels stack vertically
+    plt.plot(data + np.arange(channels))
+    plt.legend([f"Channel {i + 1}" for i in range(channels)], loc="upper right")
+    plt.title(os.path.basename(bin_path))
+    plt.xlabel("bin")
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot a peak.bin or mean.bin waveform binary for inspection.")
+    parser.add_argument("bin_file", help="Input .bin file (interleaved float32)")
+    parser.add_argument("--channels", type=int, default=16, help="Channel count of the binary")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.bin_file):
+        print(f"Error: The file '{args.bin_file}' does not exist.")
+        sys.exit(1)
+
+    visualize_bin(args.bin_file, args.channels)